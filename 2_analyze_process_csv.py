@@ -1,9 +1,11 @@
+import argparse
 import csv
+import hashlib
 import os
 import sys
 import re
 import json
-from openai_utils import SupportCategory, call_openai_completion
+from openai_utils import SupportCategory, call_openai_completion, mock_openai_completion
 
 # カテゴリのリストを定義
 USER_REQUEST_CATEGORIES = [
@@ -27,62 +29,104 @@ SUPPORT_RESPONSE_CATEGORIES = [
     "other"
 ]
 
-def process_csv(input_file):
-    # CSVファイルを読み込む
+SR_NUMBER_KEY = "SR番号"  # SR番号のカラム名
+
+def read_csv_rows(input_file):
+    """CSVファイルを読み込み、行データのリストを返す"""
     try:
         with open(input_file, 'r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
-            rows = list(reader)
+            return list(reader)
     except UnicodeDecodeError:
         # UTF-8で開けない場合はCP932(Shift-JIS)で試行
         with open(input_file, 'r', encoding='cp932') as f:
             reader = csv.DictReader(f)
-            rows = list(reader)
-    except Exception as e:
-        print(f"CSVファイルの読み込み中にエラーが発生しました: {e}")
-        return
-            
-    if not rows:
-        print("CSVファイルにデータがありませんでした。")
-        return
-        
-    # 件名と本文カラムの存在チェック
-    print(f"最初の行のデータ: {rows[0]}")
-    
-    # キーに「件名」と「本文」を含むものを探す
+            return list(reader)
+
+def find_subject_and_body_keys(row):
+    """「件名」と「本文」を含むカラム名を返す(見つからない場合はNone)"""
     subject_key = None
     body_key = None
-    sr_number_key = "SR番号"  # SR番号のカラム名
     
-    for key in rows[0].keys():
+    for key in row.keys():
         # BOMと引用符を取り除いたキー名で比較
         clean_key = re.sub(r'[\ufeff"\']', '', key)
         if '件名' in clean_key:
             subject_key = key
-            print(f"'件名'を含むカラムを見つけました: '{subject_key}'")
         elif '本文' in clean_key:
             body_key = key
-            print(f"'本文'を含むカラムを見つけました: '{body_key}'")
         
         if subject_key and body_key:
             break
     
+    return subject_key, body_key
+
+def get_shard_index(sr_number, row_index, shard_count):
+    """
+    行を割り当てるシャード番号(0始まり)を返す
+    SR番号の安定したハッシュで割り当てるため、重複したSR番号は必ず同じシャードに入る。
+    SR番号が空の行は行番号で割り当てる。
+    """
+    key = sr_number if sr_number else f"row:{row_index}"
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return int(digest, 16) % shard_count
+
+def get_output_filepath(input_file, shard=None):
+    """解析結果の出力ファイルパスを返す(シャード指定時はシャードごとのファイル)"""
+    input_filename = os.path.basename(input_file)
+    if shard:
+        shard_number, shard_count = shard
+        input_filename = f"shard{shard_number}of{shard_count}_{input_filename}"
+    return os.path.join(os.path.dirname(input_file), f"analyzed_{input_filename}")
+
+def process_csv(input_file, shard=None, completion_func=call_openai_completion):
+    """CSVファイルを解析して結果を書き込む(途中で中止した場合はFalseを返す)"""
+    # 出力ファイル名を設定
+    output_filepath = get_output_filepath(input_file, shard)
+    
+    # シャード指定時は、途中で中止しても結合時に前回の解析結果を使わないよう先に削除する
+    if shard and os.path.exists(output_filepath):
+        os.remove(output_filepath)
+        print(f"前回の解析結果 {output_filepath} を削除しました")
+    
+    # CSVファイルを読み込む
+    try:
+        rows = read_csv_rows(input_file)
+    except Exception as e:
+        print(f"CSVファイルの読み込み中にエラーが発生しました: {e}")
+        return False
+            
+    if not rows:
+        print("CSVファイルにデータがありませんでした。")
+        return False
+        
+    # 件名と本文カラムの存在チェック
+    print(f"最初の行のデータ: {rows[0]}")
+    
+    # キーに「件名」と「本文」を含むものを探す
+    subject_key, body_key = find_subject_and_body_keys(rows[0])
+    sr_number_key = SR_NUMBER_KEY
+    
+    if subject_key:
+        print(f"'件名'を含むカラムを見つけました: '{subject_key}'")
+    if body_key:
+        print(f"'本文'を含むカラムを見つけました: '{body_key}'")
+    
     if not subject_key:
         print("CSVファイルに「件名」カラムがありません。処理を中止します。")
-        return
+        return False
 
     if not body_key:
         print("CSVファイルに「本文」カラムがありません。処理を中止します。")
-        return
+        return False
     
     # SR番号カラムの存在チェック
     sr_number_exists = sr_number_key in rows[0]
     if not sr_number_exists:
         print(f"警告: CSVファイルに「{sr_number_key}」カラムがありません。重複チェックは件名のみで行います。")
     
-    # 出力ファイル名を設定
-    input_filename = os.path.basename(input_file)
-    output_filepath = os.path.join(os.path.dirname(input_file), f"analyzed_{input_filename}")
+    if shard:
+        print(f"シャード {shard[0]}/{shard[1]} の行のみを処理します")
     print(f"解析結果は {output_filepath} に保存されます")
 
     # 出力用のフィールド名を設定
@@ -110,12 +154,18 @@ def process_csv(input_file):
     # 各行を処理
     total_rows = len(rows)
     skipped_rows = 0
+    other_shard_rows = 0
     api_error = False
     
     for i, row in enumerate(rows, 1):
         # SR番号の重複チェック
         sr_number = row.get(sr_number_key, "") if sr_number_exists else ""
         
+        # シャード指定時は担当外の行をスキップ(重複チェックより先に判定しても、重複行は同じシャードに入る)
+        if shard and get_shard_index(sr_number, i, shard[1]) != shard[0] - 1:
+            other_shard_rows += 1
+            continue
+        
         # SR番号が存在し、すでに処理済みの場合はスキップ
         if sr_number and sr_number in processed_sr_numbers:
             print(f"スキップ... {i}/{total_rows}: SR番号 {sr_number} は重複しています。")
@@ -138,7 +188,7 @@ def process_csv(input_file):
             body = row[body_key]
             try:
                 # OpenAI APIを呼び出して解析
-                support_category = call_openai_completion(body, SupportCategory)
+                support_category = completion_func(body, SupportCategory)
                 
                 # 結果をCSV用に整形
                 new_row["closed"] = getattr(support_category, "closed", "")  # closedフィールドがあれば取得、なければ空文字
@@ -180,10 +230,12 @@ def process_csv(input_file):
 
     # APIエラーが発生した場合は中止
     if api_error:
-        return
+        return False
 
     # フィルタリング結果のログ出力
     print(f"\n全行数: {total_rows}")
+    if shard:
+        print(f"他のシャードに割り当てられた行数: {other_shard_rows}")
     print(f"重複により除外された行数: {skipped_rows}")
     print(f"処理された行数: {len(analyzed_rows)}")
 
@@ -197,6 +249,8 @@ def process_csv(input_file):
         print(f"\n解析が完了しました。結果は {output_filepath} に保存されました。")
     except Exception as e:
         print(f"ファイル書き込み中にエラーが発生しました: {e}")
+        return False
+    return True
 
 def set_empty_values(row):
     """エラー発生時などに行データに空の値をセットする"""
@@ -214,23 +268,156 @@ def set_empty_values(row):
     for category in SUPPORT_RESPONSE_CATEGORIES:
         row[f"css_{category}"] = 0
 
+def merge_shards(input_file, shard_count):
+    """
+    シャードごとの解析結果(analyzed_shard*of*_*)を元のCSVの行順に結合する
+    元のCSVと同じ重複除去を行い、SR番号の欠落や重複がないことを確認してから書き込む
+    """
+    try:
+        rows = read_csv_rows(input_file)
+    except Exception as e:
+        print(f"CSVファイルの読み込み中にエラーが発生しました: {e}")
+        return False
+
+    if not rows:
+        print("CSVファイルにデータがありませんでした。")
+        return False
+
+    sr_number_exists = SR_NUMBER_KEY in rows[0]
+    subject_key, _ = find_subject_and_body_keys(rows[0])
+    if not subject_key:
+        print("CSVファイルに「件名」カラムがありません。処理を中止します。")
+        return False
+
+    # シャードごとの解析結果を読み込む
+    shard_rows = []
+    output_fieldnames = None
+    for shard_number in range(1, shard_count + 1):
+        shard_filepath = get_output_filepath(input_file, (shard_number, shard_count))
+        if not os.path.exists(shard_filepath):
+            print(f"エラー: シャード {shard_number}/{shard_count} の解析結果 {shard_filepath} が見つかりません。")
+            return False
+        with open(shard_filepath, 'r', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            if output_fieldnames is None:
+                output_fieldnames = reader.fieldnames
+            elif reader.fieldnames != output_fieldnames:
+                print(f"エラー: {shard_filepath} のカラムが他のシャードと一致しません。")
+                return False
+            if subject_key not in output_fieldnames:
+                print(f"エラー: {shard_filepath} に「{subject_key}」カラムがありません。")
+                return False
+            shard_rows.append(list(reader))
+        print(f"シャード {shard_number}/{shard_count}: {len(shard_rows[-1])} 行を読み込みました")
+
+    # 元のCSVの行順にシャードの結果を並べ直す
+    merged_rows = []
+    processed_sr_numbers = set()
+    positions = [0] * shard_count
+    for i, row in enumerate(rows, 1):
+        sr_number = row.get(SR_NUMBER_KEY, "") if sr_number_exists else ""
+        if sr_number and sr_number in processed_sr_numbers:
+            continue
+        if sr_number:
+            processed_sr_numbers.add(sr_number)
+
+        shard_index = get_shard_index(sr_number, i, shard_count)
+        if positions[shard_index] >= len(shard_rows[shard_index]):
+            print(f"エラー: {i}行目(SR番号 {sr_number or 'なし'})の解析結果がシャード {shard_index + 1}/{shard_count} にありません。")
+            return False
+        shard_row = shard_rows[shard_index][positions[shard_index]]
+        positions[shard_index] += 1
+
+        if sr_number_exists and shard_row.get(SR_NUMBER_KEY, "") != sr_number:
+            print(f"エラー: {i}行目のSR番号 {sr_number} に対し、シャード {shard_index + 1}/{shard_count} の結果はSR番号 {shard_row.get(SR_NUMBER_KEY, '')} です。")
+            return False
+        # SR番号が空の行も対応が確認できるよう、件名も一致することを確認する
+        if shard_row[subject_key] != row[subject_key]:
+            print(f"エラー: {i}行目の件名がシャード {shard_index + 1}/{shard_count} の結果と一致しません。古い解析結果や別の入力ファイルの結果が混ざっていないか確認してください。")
+            return False
+        merged_rows.append(shard_row)
+
+    # 余った行があれば重複または別の入力ファイルの結果が混ざっている
+    for shard_index in range(shard_count):
+        extra_rows = len(shard_rows[shard_index]) - positions[shard_index]
+        if extra_rows:
+            print(f"エラー: シャード {shard_index + 1}/{shard_count} に元のCSVに対応しない行が {extra_rows} 行あります。")
+            return False
+
+    if sr_number_exists:
+        merged_sr_numbers = [row[SR_NUMBER_KEY] for row in merged_rows if row[SR_NUMBER_KEY]]
+        if len(merged_sr_numbers) != len(set(merged_sr_numbers)) or set(merged_sr_numbers) != processed_sr_numbers:
+            print("エラー: 結合結果のSR番号に欠落または重複があります。")
+            return False
+
+    print(f"\n全行数: {len(rows)}")
+    print(f"結合された行数: {len(merged_rows)}")
+
+    output_filepath = get_output_filepath(input_file)
+    try:
+        with open(output_filepath, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=output_fieldnames)
+            writer.writeheader()
+            for row in merged_rows:
+                writer.writerow(row)
+        print(f"\n結合が完了しました。結果は {output_filepath} に保存されました。")
+    except Exception as e:
+        print(f"ファイル書き込み中にエラーが発生しました: {e}")
+        return False
+    return True
+
+def parse_shard(value):
+    """--shard i/N の指定を (i, N) に変換する(iは1始まり)"""
+    try:
+        shard_number, shard_count = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"シャードは i/N 形式で指定してください: {value}")
+    if shard_count < 1 or not 1 <= shard_number <= shard_count:
+        raise argparse.ArgumentTypeError(f"シャード番号は 1 から N の範囲で指定してください: {value}")
+    return shard_number, shard_count
+
+def parse_shard_count(value):
+    """--merge N の指定を検証する"""
+    try:
+        shard_count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"シャード数は整数で指定してください: {value}")
+    if shard_count < 1:
+        raise argparse.ArgumentTypeError(f"シャード数は1以上で指定してください: {value}")
+    return shard_count
+
+def print_usage():
+    print("python 2_analyze_process_csv.py [CSVファイルのパス] [--mock] [--shard i/N | --merge N]")
+    print("\n例: python 2_analyze_process_csv.py cleaned_sample.CSV")
+    print("\n例: python 2_analyze_process_csv.py cleaned_sample.CSV --shard 1/4")
+    print("\n例: python 2_analyze_process_csv.py cleaned_sample.CSV --merge 4")
+    print("\n注意: このスクリプトは1_clean_process_csv.pyで処理された「cleaned_」から始まるCSVファイルを入力として想定しています。")
+
 if __name__ == "__main__":
-    # コマンドライン引数からファイルパスを取得
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument("input_file", nargs="?")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard", type=parse_shard, help="i/N 形式で指定したシャードの行のみを解析します(iは1始まり)")
+    group.add_argument("--merge", type=parse_shard_count, metavar="N", help="N個のシャードの解析結果を元の行順に結合します")
+    parser.add_argument("-m", "--mock", action="store_true", help="OpenAI APIの代わりにモック関数を使用します")
+    args = parser.parse_args()
+
+    if args.input_file:
+        input_file = args.input_file
         
         # ファイルが存在するか確認
-        if os.path.exists(input_file):
-            process_csv(input_file)
-        else:
+        if not os.path.exists(input_file):
             print(f"\nエラー: ファイル {input_file} が見つかりません。")
             print("\nファイルパスを指定して再度実行してください:")
-            print("python 2_analyze_process_csv.py [CSVファイルのパス]")
-            print("\n例: python 2_analyze_process_csv.py cleaned_sample.CSV")
-            print("\n注意: このスクリプトは1_clean_process_csv.pyで処理された「cleaned_」から始まるCSVファイルを入力として想定しています。")
+            print_usage()
+        elif args.merge is not None:
+            if not merge_shards(input_file, args.merge):
+                sys.exit(1)
+        else:
+            completion_func = mock_openai_completion if args.mock else call_openai_completion
+            if not process_csv(input_file, args.shard, completion_func):
+                sys.exit(1)
     else:
         print("\nエラー: 入力ファイルが指定されていません。")
         print("\nファイルパスを指定して実行してください:")
-        print("python 2_analyze_process_csv.py [CSVファイルのパス]")
-        print("\n例: python 2_analyze_process_csv.py cleaned_sample.CSV")
-        print("\n注意: このスクリプトは1_clean_process_csv.pyで処理された「cleaned_」から始まるCSVファイルを入力として想定しています。")
\ No newline at end of file
+        print_usage()
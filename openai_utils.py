@@ -87,6 +87,18 @@ def call_openai_completion(body: str, response_format: BaseModel):
 
     return event
 
+def mock_openai_completion(body, response_format):
+    """APIキーなしで動作確認するための固定の解析結果を返す"""
+    return SupportCategory(
+        closed=1,
+        bug=0,
+        customer_reporter="不明",
+        customer_email="不明",
+        email_exchanges_over_ten=0,
+        user_request_category=["other"],
+        support_team_response_category=["other"],
+    )
+
 def get_parsed_completion(messages: list[dict], response_format: BaseModel):
     """
     Get parsed completion from Azure OpenAI.
@@ -0,0 +1,121 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from z_stub_openai_server import start_stub_server
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request_json(url, payload=None):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=30) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def wait_for_health(service_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if request_json(f"{service_url}/health").get("status") == "ok":
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def check_service():
+    """
+    スタブサーバーと解析サービスを起動し、/classifyの結果、重複排除、キャッシュ、/metricsを確認します
+    解析サービスは実際のopenai_utils(AzureOpenAIクライアント)を通してスタブサーバーを呼び出します
+    """
+    # 解析中に後続のリクエストが届くよう、スタブの応答を遅らせる
+    stub_server = start_stub_server(delay=0.5)
+    stub_url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    service_port = get_free_port()
+    service_url = f"http://127.0.0.1:{service_port}"
+    print(f"スタブサーバー: {stub_url}")
+    print(f"解析サービス: {service_url}")
+
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": stub_url,
+        "AZURE_OPENAI_API_KEY": "stub",
+        "MODEL_DEPLOYMENT_NAME": "stub",
+    })
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "z_classify_service.py")
+    process = subprocess.Popen(
+        [sys.executable, script_path, "--port", str(service_port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    failures = []
+
+    def check(condition, message):
+        print(f"{'OK' if condition else 'NG'}: {message}")
+        if not condition:
+            failures.append(message)
+
+    try:
+        if not wait_for_health(service_url, process):
+            print("エラー: 解析サービスが起動しませんでした。")
+            return False
+
+        # 同じSR番号・同じ本文4件と、同じSR番号で本文が異なる1件を同時に送る
+        requests = [("SR1", "本文A")] * 4 + [("SR1", "本文B 不具合")]
+        responses = [None] * len(requests)
+
+        def post(index, sr_number, body):
+            responses[index] = request_json(f"{service_url}/classify", {"sr_number": sr_number, "body": body})
+
+        threads = [threading.Thread(target=post, args=(i, sr, body)) for i, (sr, body) in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+
+        check(all(r is not None for r in responses), "すべてのリクエストに応答があること")
+        if failures:
+            return False
+        check(all(r["result"]["bug"] == 0 for r in responses[:4]), "本文Aの解析結果が本文Aのものであること")
+        check(responses[4]["result"]["bug"] == 1, "本文Bの解析結果が本文Bのものであること")
+
+        stats = request_json(f"{stub_url}/stats")
+        check(stats["calls"] == 2, f"API呼び出しが本文ごとに1回であること (呼び出し回数: {stats['calls']})")
+
+        cached_response = request_json(f"{service_url}/classify", {"sr_number": "SR1", "body": "本文A"})
+        check(cached_response["cached"], "同じSR番号・同じ本文の再リクエストがキャッシュから返ること")
+        check(request_json(f"{stub_url}/stats")["calls"] == 2, "キャッシュから返した場合にAPIを呼び出さないこと")
+
+        metrics = request_json(f"{service_url}/metrics")
+        print(f"metrics: {metrics}")
+        check(metrics["requests_total"] == 6, "requests_totalが6であること")
+        check(metrics["api_calls"] == 2, "api_callsが2であること")
+        check(metrics["deduplicated"] == 3, "deduplicatedが3であること")
+        check(metrics["cache_hits"] == 1, "cache_hitsが1であること")
+    finally:
+        process.terminate()
+        process.wait()
+        stub_server.shutdown()
+
+    return not failures
+
+
+if __name__ == "__main__":
+    if check_service():
+        print("\n確認が完了しました。すべての項目が成功しました。")
+    else:
+        print("\n確認に失敗した項目があります。")
+        sys.exit(1)
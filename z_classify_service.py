@@ -0,0 +1,272 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# openai_utilsはプロセス起動時に一度だけ読み込み、生成済みのクライアント(内部で接続プールを保持)を使い回す
+from openai_utils import SupportCategory, call_openai_completion, mock_openai_completion
+
+
+class RateLimiter:
+    """1分あたりのリクエスト数を制限する(0の場合は制限なし)"""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            # 停止時は待機を打ち切る
+            self.stopped.wait(wait_time)
+
+
+class PendingRequest:
+    """同じSR番号・同じ本文のリクエストが共有する解析結果の待ち合わせ"""
+
+    def __init__(self, cache_key):
+        self.cache_key = cache_key
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ClassificationService:
+    """
+    メールスレッドの解析リクエストを並行して処理する
+
+    SR番号(SR番号がない場合は本文のハッシュ)ごとに同時に解析するのは1件だけとし、
+    同じSR番号・同じ本文のリクエストが解析中に届いた場合はAPIを呼び出さずに結果を共有する。
+    同じSR番号で本文が異なる(スレッドが更新された)リクエストは、解析中のリクエストが終わってから解析する。
+    解析結果はキャッシュし、同じSR番号・同じ本文の再リクエストにはAPIを呼ばずに返す。
+    """
+
+    def __init__(self, completion_func, max_workers=4, cache_size=1024, requests_per_minute=0):
+        self.completion_func = completion_func
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.rate_limiter = RateLimiter(requests_per_minute)
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+        # 解析待ち・解析中のリクエスト(SR番号 -> PendingRequest)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.started_at = time.time()
+        self.metrics = {
+            "requests_total": 0,
+            "cache_hits": 0,
+            "deduplicated": 0,
+            "waited_for_same_sr": 0,
+            "api_calls": 0,
+            "api_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(sr_number, body):
+        body_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        # 重複判定はSR番号で行い、キャッシュは本文が変わった場合に再解析できるよう本文のハッシュも含める
+        dedup_key = sr_number if sr_number else body_hash
+        return dedup_key, (dedup_key, body_hash)
+
+    def classify(self, sr_number, body, timeout=None):
+        """
+        解析結果を返す(同期呼び出し)
+
+        Returns:
+            tuple: 解析結果(SupportCategory)、キャッシュから返したかどうか
+        """
+        dedup_key, cache_key = self.make_key(sr_number, body)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        with self.lock:
+            self.metrics["requests_total"] += 1
+
+        while True:
+            with self.lock:
+                if cache_key in self.cache:
+                    self.cache.move_to_end(cache_key)
+                    self.metrics["cache_hits"] += 1
+                    return self.cache[cache_key], True
+
+                pending = self.pending.get(dedup_key)
+                if pending is None:
+                    pending = PendingRequest(cache_key)
+                    self.pending[dedup_key] = pending
+                    self.executor.submit(self._process, dedup_key, pending, body)
+                elif pending.cache_key == cache_key:
+                    # 同じSR番号・同じ本文のリクエストが解析中なら結果を共有する
+                    self.metrics["deduplicated"] += 1
+                else:
+                    # 同じSR番号で本文が異なるリクエストが解析中なら、終わるのを待ってから解析する
+                    self.metrics["waited_for_same_sr"] += 1
+
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            if not pending.done.wait(remaining):
+                raise TimeoutError(f"SR番号 {dedup_key} の解析がタイムアウトしました。")
+            if pending.cache_key != cache_key:
+                continue
+            if pending.error is not None:
+                raise pending.error
+            return pending.result, False
+
+    def _process(self, dedup_key, pending, body):
+        result = None
+        error = None
+        try:
+            self.rate_limiter.wait()
+            if self.rate_limiter.stopped.is_set():
+                raise RuntimeError("解析サービスを停止中です。")
+            with self.lock:
+                self.metrics["api_calls"] += 1
+            result = self.completion_func(body, SupportCategory)
+        except Exception as e:
+            error = e
+
+        with self.lock:
+            del self.pending[dedup_key]
+            if error is None:
+                self.cache[pending.cache_key] = result
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            else:
+                self.metrics["api_errors"] += 1
+
+        pending.result = result
+        pending.error = error
+        pending.done.set()
+
+    def close(self):
+        """レート制限の待機を打ち切り、未着手の解析をキャンセルする"""
+        self.rate_limiter.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["cache_size"] = len(self.cache)
+            metrics["pending"] = len(self.pending)
+        metrics["uptime_seconds"] = round(time.time() - self.started_at, 1)
+        return metrics
+
+
+class ClassificationRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    request_timeout = None
+    # メールスレッド1件としては十分な上限(これを超えるリクエストは413を返す)
+    max_request_bytes = 10 * 1024 * 1024
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.service.get_metrics())
+        else:
+            self._send_json(404, {"error": "見つかりません。"})
+
+    def do_POST(self):
+        if self.path != "/classify":
+            self._send_json(404, {"error": "見つかりません。"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("Content-Length が不正です。")
+            if length > self.max_request_bytes:
+                # 本文を読まずに応答するため、接続は閉じる
+                self.close_connection = True
+                self._send_json(413, {"error": f"リクエストが大きすぎます(上限: {self.max_request_bytes} バイト)。"})
+                return
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+            sr_number = payload.get("sr_number", "")
+            body = payload["body"]
+            if sr_number is None:
+                sr_number = ""
+            if isinstance(sr_number, bool) or not isinstance(sr_number, (str, int, float)) or not isinstance(body, str):
+                raise TypeError("sr_number は文字列または数値、body は文字列で指定してください。")
+            sr_number = str(sr_number)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._send_json(400, {"error": "リクエストは {\"sr_number\": ..., \"body\": ...} 形式のJSONで指定してください。"})
+            return
+
+        if not body:
+            self._send_json(400, {"error": "本文が空です。"})
+            return
+
+        try:
+            support_category, cached = self.service.classify(sr_number, body, self.request_timeout)
+        except TimeoutError as te:
+            self._send_json(504, {"error": str(te)})
+            return
+        except Exception as e:
+            self._send_json(502, {"error": f"解析中にエラーが発生しました: {e}"})
+            return
+
+        self._send_json(200, {
+            "sr_number": sr_number,
+            "cached": cached,
+            "result": support_category.model_dump(),
+        })
+
+    def _send_json(self, status, data):
+        response = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メールスレッドの解析をHTTPサービスとして常駐実行します")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト (既定: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="待ち受けるポート (既定: 8080)")
+    parser.add_argument("--workers", type=int, default=4, help="API呼び出しの同時実行数 (既定: 4)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="キャッシュする解析結果の最大件数 (既定: 1024)")
+    parser.add_argument("--rpm", type=int, default=0, help="1分あたりのAPI呼び出し上限 (既定: 0 = 制限なし)")
+    parser.add_argument("--timeout", type=float, default=300, help="1リクエストの最大待ち時間(秒) (既定: 300)")
+    parser.add_argument("-m", "--mock", action="store_true", help="OpenAI APIの代わりにモック関数を使用します")
+    args = parser.parse_args()
+
+    completion_func = mock_openai_completion if args.mock else call_openai_completion
+    if not args.mock and not all(os.getenv(var) for var in ["AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "MODEL_DEPLOYMENT_NAME"]):
+        print("環境変数を設定するか、--mockオプションを指定して再実行してください。")
+        sys.exit(1)
+
+    ClassificationRequestHandler.service = ClassificationService(
+        completion_func,
+        max_workers=args.workers,
+        cache_size=args.cache_size,
+        requests_per_minute=args.rpm,
+    )
+    ClassificationRequestHandler.request_timeout = args.timeout
+
+    server = ThreadingHTTPServer((args.host, args.port), ClassificationRequestHandler)
+    print(f"解析サービスを http://{args.host}:{args.port} で起動しました{'（モックモード）' if args.mock else ''}")
+    print("POST /classify, GET /health, GET /metrics を受け付けます。Ctrl+Cで停止します。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n解析サービスを停止します。")
+    finally:
+        server.server_close()
+        ClassificationRequestHandler.service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_support_category(body):
+    """本文から決まる固定の解析結果を返す(同じ本文には必ず同じ結果を返す)"""
+    bug = 1 if "不具合" in body else 0
+    return {
+        "closed": 1 if "クローズ" in body else 0,
+        "bug": bug,
+        "customer_reporter": "不明",
+        "customer_email": "不明",
+        "email_exchanges_over_ten": 0,
+        "user_request_category": ["productFailure" if bug else "specConfirmation"],
+        "support_team_response_category": ["reportedProductFailure" if bug else "providedPublicDocs"],
+    }
+
+
+class StubOpenAIRequestHandler(BaseHTTPRequestHandler):
+    """
+    Azure OpenAIのチャット補完APIを模したスタブ
+
+    POST /openai/deployments/{デプロイ名}/chat/completions にSupportCategory形式のJSONを返す。
+    GET /stats で受け付けた呼び出し回数と本文を返す。
+    """
+    delay = 0.0
+    calls = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        match = re.match(r"^/openai/deployments/([^/]+)/chat/completions", self.path)
+        if not match:
+            self._send_json(404, {"error": {"message": "見つかりません。"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length).decode("utf-8"))
+        body = next((m["content"] for m in request["messages"] if m["role"] == "user"), "")
+        with self.lock:
+            self.calls.append(body)
+
+        # 解析中に同じSR番号のリクエストが届く状況を再現するため、応答を遅らせる
+        time.sleep(self.delay)
+
+        content = json.dumps(stub_support_category(body), ensure_ascii=False)
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{len(self.calls)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": match.group(1),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(body), "completion_tokens": len(content), "total_tokens": len(body) + len(content)},
+        })
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.lock:
+                self._send_json(200, {"calls": len(self.calls), "bodies": list(self.calls)})
+        else:
+            self._send_json(404, {"error": {"message": "見つかりません。"}})
+
+    def _send_json(self, status, data):
+        response = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(host="127.0.0.1", port=0, delay=0.0):
+    """スタブサーバーを別スレッドで起動し、サーバーを返す(port=0の場合は空いているポートを使う)"""
+    StubOpenAIRequestHandler.delay = delay
+    StubOpenAIRequestHandler.calls = []
+    server = ThreadingHTTPServer((host, port), StubOpenAIRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Azure OpenAIのスタブサーバーを起動します")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト (既定: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000, help="待ち受けるポート (既定: 9000)")
+    parser.add_argument("--delay", type=float, default=0.0, help="応答を遅らせる秒数 (既定: 0)")
+    args = parser.parse_args()
+
+    StubOpenAIRequestHandler.delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), StubOpenAIRequestHandler)
+    print(f"スタブサーバーを http://{args.host}:{args.port} で起動しました。Ctrl+Cで停止します。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nスタブサーバーを停止します。")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()